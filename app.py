@@ -2,11 +2,19 @@ import logging
 import os
 import re
 import asyncio
+import functools
 from datetime import datetime
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import (Update, ReplyKeyboardMarkup, ReplyKeyboardRemove,
+                      InlineQueryResultArticle, InputTextMessageContent)
 from telegram.ext import (Application, CommandHandler, MessageHandler, 
-                         ConversationHandler, CallbackContext)
+                         ConversationHandler, CallbackContext, InlineQueryHandler)
 from telegram.ext import filters
+from telegram.request import HTTPXRequest
+
+from catalog import PartCatalog
+from crossref import CrossReferenceIndex, extract_articles
+from stats import LiveStats
+from recorder import Recorder, RecordingRequest, Scrubber
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,14 +31,87 @@ if not BOT_TOKEN:
 
 ADMIN_CHAT_ID = "1079922982"
 
+# Папка с файлами кросс-номеров (OEM;аналог;аналог...), новые файлы подхватываются на лету
+CROSSREF_DIR = os.environ.get('CROSSREF_DIR', 'crossref')
+CROSSREF_REFRESH_INTERVAL = 5*60
+MAX_ANALOGS_IN_NOTIFICATION = 30
+# Ограничение Telegram на длину одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+# Файл со счетчиками статистики и период его сохранения
+STATS_FILE = os.environ.get('STATS_FILE', 'stats.json')
+STATS_SAVE_INTERVAL = 60
+
+# Запись входящих апдейтов и вызовов Bot API для воспроизведения через replay.py
+RECORD_FILE = os.environ.get('RECORD_FILE')
+RECORD_SALT = os.environ.get('RECORD_SALT', '').encode('utf-8') or os.urandom(16)
+# Вопрос бота, после которого пользователь присылает VIN/СТС — ответ на него маскируется целиком
+VIN_TEXT_PROMPT = "Введите вин номер или номер стс"
+
+# Каталог для inline-поиска запчастей (название;артикул)
+CATALOG_FILE = os.environ.get('CATALOG_FILE', 'catalog.csv')
+INLINE_RESULTS_LIMIT = 50
+INLINE_CACHE_TIME = 300
+INLINE_DEBOUNCE = 0.3
+
 # Состояния диалога
 (CITY, CAR_BRAND, CAR_MODEL, CAR_YEAR, VIN_OR_STS, VIN_TEXT, ENGINE_VOLUME, ENGINE_FUEL,
  PART_MAIN, PART_REFINEMENT, PART_SPECIFICS, PART_PHOTO, MORE_PARTS, 
  CONTACT_INFO, CONFIRMATION, EDIT_CHOICE) = range(16)
 
+# Названия шагов для статистики
+STATE_NAMES = {
+    CITY: 'Город', CAR_BRAND: 'Марка', CAR_MODEL: 'Модель', CAR_YEAR: 'Год',
+    VIN_OR_STS: 'вин/стс', VIN_TEXT: 'вин текстом', ENGINE_VOLUME: 'Объем двигателя',
+    ENGINE_FUEL: 'Топливо', PART_MAIN: 'Запчасть', PART_REFINEMENT: 'Уточнение запчасти',
+    PART_SPECIFICS: 'Артикул', PART_PHOTO: 'Фото запчасти', MORE_PARTS: 'Еще запчасти',
+    CONTACT_INFO: 'Контакты', CONFIRMATION: 'Подтверждение', EDIT_CHOICE: 'Исправление',
+}
+
+# Обязательные шаги в порядке прохождения — по ним считается воронка
+FUNNEL_STATES = [CITY, CAR_BRAND, CAR_MODEL, CAR_YEAR, VIN_OR_STS, ENGINE_VOLUME, ENGINE_FUEL,
+                 PART_MAIN, PART_REFINEMENT, MORE_PARTS, CONTACT_INFO, CONFIRMATION]
+
 # Хранилище для напоминаний
 user_reminders = {}
 
+# Индекс аналогов по артикулам
+crossref_index = CrossReferenceIndex(CROSSREF_DIR)
+
+# Статистика заявок
+live_stats = LiveStats(STATS_FILE)
+
+# Каталог запчастей и последний inline-запрос каждого пользователя
+part_catalog = PartCatalog(CATALOG_FILE)
+latest_inline_queries = {}
+# Сообщения, отправленные через inline-режим этого бота; имя бота добавляется в post_init
+inline_result_filter = filters.ViaBot()
+
+# Запись трафика, если включена через RECORD_FILE
+traffic_recorder = None
+
+# Бесконечные фоновые циклы: цикл событий держит задачи только по слабой ссылке,
+# поэтому ссылки хранятся здесь, а при остановке бота задачи отменяются
+background_tasks = []
+
+def mark_state_reached(context: CallbackContext, state: int):
+    """Учесть в воронке шаг, если пользователь дошел до него впервые за сессию"""
+    reached = context.user_data.setdefault('funnel_states', [])
+    if state not in reached:
+        reached.append(state)
+        live_stats.record_state(STATE_NAMES[state])
+
+def track_state(callback):
+    """Учитывать в статистике шаги диалога, до которых дошел пользователь"""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: CallbackContext):
+        state = await callback(update, context)
+        if state in STATE_NAMES:
+            mark_state_reached(context, state)
+        return state
+    return wrapper
+
+@track_state
 async def start(update: Update, context: CallbackContext):
     """Начало диалога, сбрасывает все состояния"""
     # Останавливаем все напоминания для этого пользователя
@@ -42,6 +123,7 @@ async def start(update: Update, context: CallbackContext):
     
     # Полностью очищаем данные пользователя
     context.user_data.clear()
+    live_stats.record_start(user_id)
     
     welcome_text = """
 🔧 *Добро пожаловать в АвтоЗапчасти 24/7!*
@@ -90,9 +172,67 @@ async def send_reminder(context: CallbackContext, user_id: int, chat_id: int, de
         # Проверяем, не завершил ли пользователь заявку
         if user_id in user_reminders:
             await context.bot.send_message(chat_id=chat_id, text=message)
+            live_stats.record_reminder(user_id)
     except Exception as e:
         logger.error(f"Ошибка отправки напоминания: {e}")
 
+async def refresh_crossref_periodically():
+    """Периодически подгружать новые файлы кросс-номеров"""
+    # Первая загрузка тоже идет в фоне: до ее окончания аналоги просто не показываются
+    while True:
+        try:
+            await asyncio.to_thread(crossref_index.refresh)
+        except Exception as e:
+            logger.error(f"Ошибка обновления кросс-номеров: {e}")
+        await asyncio.sleep(CROSSREF_REFRESH_INTERVAL)
+
+def format_part_analogs(details: str, shown_groups: set, limit: int):
+    """Строка с аналогами для артикулов из деталей запчасти и число показанных аналогов.
+
+    Каждая группа аналогов выводится один раз на заявку: группы, уже
+    попавшие в shown_groups, пропускаются. Всего выводится не больше limit аналогов.
+    """
+    lines = []
+    shown = 0
+    for article in extract_articles(details):
+        if shown >= limit:
+            break
+        group = crossref_index.group(article)
+        if group is None or group in shown_groups:
+            continue
+        shown_groups.add(group)
+        left = limit - shown
+        analogs = crossref_index.analogs(article, limit=left + 1)
+        if not analogs:
+            continue
+        line = f"\n   Аналоги {article}: {', '.join(analogs[:left])}"
+        if len(analogs) > left:
+            line += " и др."
+        lines.append(line)
+        shown += min(len(analogs), left)
+    return ''.join(lines), shown
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list:
+    """Делит длинный текст на сообщения не длиннее limit, по возможности по строкам"""
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+@track_state
 async def get_city(update: Update, context: CallbackContext):
     """Получение города"""
     context.user_data['city'] = update.message.text
@@ -103,6 +243,7 @@ async def get_city(update: Update, context: CallbackContext):
         await update.message.reply_text(f"📍 *Город: {update.message.text}*\n\nУкажите *марку* автомобиля:", parse_mode='Markdown')
         return CAR_BRAND
 
+@track_state
 async def get_car_brand(update: Update, context: CallbackContext):
     """Получение марки автомобиля"""
     context.user_data['car_brand'] = update.message.text
@@ -113,6 +254,7 @@ async def get_car_brand(update: Update, context: CallbackContext):
         await update.message.reply_text(f"🚗 *Марка: {update.message.text}*\n\nУкажите *модель*:", parse_mode='Markdown')
         return CAR_MODEL
 
+@track_state
 async def get_car_model(update: Update, context: CallbackContext):
     """Получение модели автомобиля"""
     context.user_data['car_model'] = update.message.text
@@ -123,6 +265,7 @@ async def get_car_model(update: Update, context: CallbackContext):
         await update.message.reply_text(f"🚙 *Модель: {update.message.text}*\n\nУкажите *год выпуска*:", parse_mode='Markdown')
         return CAR_YEAR
 
+@track_state
 async def get_car_year(update: Update, context: CallbackContext):
     """Получение года выпуска"""
     year = update.message.text
@@ -148,13 +291,14 @@ async def get_car_year(update: Update, context: CallbackContext):
         )
         return VIN_OR_STS
 
+@track_state
 async def handle_vin_choice(update: Update, context: CallbackContext):
     """Обработка выбора варианта ввода VIN/СТС"""
     choice = update.message.text
     
     if choice == '📝 Ввести вин/стс вручную':
         await update.message.reply_text(
-            "🔢 *Введите вин номер или номер стс:*",
+            f"🔢 *{VIN_TEXT_PROMPT}:*",
             parse_mode='Markdown',
             reply_markup=ReplyKeyboardRemove()
         )
@@ -176,6 +320,7 @@ async def handle_vin_choice(update: Update, context: CallbackContext):
         )
         return ENGINE_VOLUME
 
+@track_state
 async def get_vin_text(update: Update, context: CallbackContext):
     """Получение VIN текстом"""
     context.user_data['vin_text'] = update.message.text
@@ -192,6 +337,7 @@ async def get_vin_text(update: Update, context: CallbackContext):
         )
         return ENGINE_VOLUME
 
+@track_state
 async def handle_vin_photo(update: Update, context: CallbackContext):
     """Обработка фото VIN/СТС"""
     if update.message.photo:
@@ -213,6 +359,7 @@ async def handle_vin_photo(update: Update, context: CallbackContext):
         await update.message.reply_text("📷 Пожалуйста, прикрепите фото вин/стс или выберите другую опцию")
         return VIN_OR_STS
 
+@track_state
 async def get_engine_volume(update: Update, context: CallbackContext):
     """Получение объема двигателя"""
     if update.message.text == '📝 Другой объем':
@@ -244,6 +391,7 @@ async def get_engine_volume(update: Update, context: CallbackContext):
         )
         return ENGINE_FUEL
 
+@track_state
 async def get_fuel_type(update: Update, context: CallbackContext):
     """Получение типа топлива"""
     context.user_data['fuel_type'] = update.message.text
@@ -272,6 +420,29 @@ async def ask_parts(update: Update, context: CallbackContext):
     await update.message.reply_text(text, parse_mode='Markdown', reply_markup=ReplyKeyboardRemove())
     return PART_MAIN
 
+@track_state
+async def add_catalog_part(update: Update, context: CallbackContext):
+    """Добавление запчасти, выбранной через inline-поиск"""
+    entry = part_catalog.find_by_message(update.message.text)
+    if entry is None:
+        return await get_part_main(update, context)
+    
+    name, article = entry
+    context.user_data.setdefault('parts', []).append({'name': name, 'details': article or 'Без уточнений'})
+    # Позиция из каталога уже уточнена: шаг уточнения в воронке считается пройденным
+    mark_state_reached(context, PART_REFINEMENT)
+    return await ask_more_parts(update, context)
+
+async def decline_catalog_part(update: Update, context: CallbackContext):
+    """Позиция из inline-поиска выбрана на шаге, где запчасти не добавляются"""
+    await update.message.reply_text(
+        "🔎 Запчасть из каталога можно добавить, когда я спрошу, какая запчасть нужна.\n\n"
+        "Сейчас, пожалуйста, ответьте на предыдущий вопрос."
+    )
+    # None оставляет диалог в текущем состоянии
+    return None
+
+@track_state
 async def get_part_main(update: Update, context: CallbackContext):
     """Получение основной информации о запчасти"""
     context.user_data['current_part'] = {'name': update.message.text, 'details': ''}
@@ -289,6 +460,7 @@ async def get_part_main(update: Update, context: CallbackContext):
     )
     return PART_REFINEMENT
 
+@track_state
 async def handle_part_refinement(update: Update, context: CallbackContext):
     """Обработка уточнений по запчасти"""
     choice = update.message.text
@@ -309,6 +481,7 @@ async def handle_part_refinement(update: Update, context: CallbackContext):
         context.user_data['parts'].append(context.user_data['current_part'])
         return await ask_more_parts(update, context)
 
+@track_state
 async def get_part_specifics(update: Update, context: CallbackContext):
     """Получение спецификаций запчасти"""
     context.user_data['current_part']['details'] = update.message.text
@@ -330,6 +503,7 @@ async def ask_part_photo(update: Update, context: CallbackContext):
     )
     return PART_PHOTO
 
+@track_state
 async def handle_part_photo(update: Update, context: CallbackContext):
     """Обработка фото запчасти"""
     if update.message.text == '🚀 Без фото':
@@ -354,6 +528,7 @@ async def ask_more_parts(update: Update, context: CallbackContext):
     )
     return MORE_PARTS
 
+@track_state
 async def handle_more_parts(update: Update, context: CallbackContext):
     """Обработка ответа о добавлении запчастей"""
     if update.message.text == '✅ Добавить еще':
@@ -371,6 +546,7 @@ async def handle_more_parts(update: Update, context: CallbackContext):
             )
             return CONTACT_INFO
 
+@track_state
 async def get_contact_info(update: Update, context: CallbackContext):
     """Получение контактной информации"""
     try:
@@ -440,6 +616,7 @@ async def show_summary(update: Update, context: CallbackContext):
     )
     return CONFIRMATION
 
+@track_state
 async def handle_confirmation(update: Update, context: CallbackContext):
     """Обработка подтверждения заказа"""
     logger.info(f"🔍 Обработка подтверждения: {update.message.text}")
@@ -478,17 +655,24 @@ async def handle_confirmation(update: Update, context: CallbackContext):
             admin_text += f"📞 Тел: {context.user_data['contact_phone']}\n\n"
             admin_text += "🔧 ЗАПРОШЕННЫЕ ЗАПЧАСТИ:\n"
             
+            # Аналоги ограничены на всю заявку, а не на каждую запчасть
+            shown_groups = set()
+            analogs_left = MAX_ANALOGS_IN_NOTIFICATION
             for i, part in enumerate(context.user_data['parts'], 1):
                 admin_text += f"\n{i}. {part['name']}"
                 if part['details'] and part['details'] != 'Без уточнений':
                     admin_text += f"\n   Детали: {part['details']}"
+                    analogs_text, shown = format_part_analogs(part['details'], shown_groups, analogs_left)
+                    admin_text += analogs_text
+                    analogs_left -= shown
                 if part.get('photo'):
                     admin_text += " 📷"
             
             logger.info(f"🔍 Отправляем администратору: {admin_text}")
             
-            # Отправляем текст администратору
-            await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=admin_text)
+            # Отправляем текст администратору, длинную заявку — несколькими сообщениями
+            for chunk in split_message(admin_text):
+                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=chunk)
             logger.info("✅ Сообщение администратору отправлено")
             
             # Пересылаем фото вин/стс если есть
@@ -510,6 +694,14 @@ async def handle_confirmation(update: Update, context: CallbackContext):
                     )
                     logger.info(f"✅ Фото запчасти {i} отправлено")
             
+            live_stats.record_order(
+                user_id,
+                context.user_data['city'],
+                context.user_data['car_brand'],
+                context.user_data['parts'],
+                datetime.now().hour
+            )
+            
             await update.message.reply_text(
                 f"🎉 *ЗАЯВКА #{order_id} ПРИНЯТА!*\n\n✅ Менеджер свяжется с вами в ближайшее время!", 
                 parse_mode='Markdown', 
@@ -536,6 +728,7 @@ async def handle_confirmation(update: Update, context: CallbackContext):
         )
         return EDIT_CHOICE
 
+@track_state
 async def handle_edit_choice(update: Update, context: CallbackContext):
     """Обработка выбора редактирования"""
     choice = update.message.text
@@ -599,6 +792,7 @@ async def cancel(update: Update, context: CallbackContext):
     await update.message.reply_text("Диалог прерван. Напишите /start для начала нового заказа", reply_markup=ReplyKeyboardRemove())
     return ConversationHandler.END
 
+@track_state
 async def fallback_handler(update: Update, context: CallbackContext):
     """Обработчик непредвиденных сообщений"""
     await update.message.reply_text(
@@ -609,6 +803,58 @@ async def fallback_handler(update: Update, context: CallbackContext):
     # Возвращаем текущее состояние, чтобы остаться в том же месте
     return context.user_data.get('conversation_state', CITY)
 
+def build_inline_results(query_text: str, offset: int):
+    """Результаты inline-поиска по каталогу и смещение следующей страницы"""
+    matches = part_catalog.search(query_text)
+    page = matches[offset:offset + INLINE_RESULTS_LIMIT]
+    results = []
+    for idx in page:
+        name, article = part_catalog.entries[idx]
+        results.append(InlineQueryResultArticle(
+            id=str(idx),
+            title=name,
+            description=f"Артикул: {article}" if article else None,
+            input_message_content=InputTextMessageContent(part_catalog.message_text(idx))
+        ))
+    next_offset = str(offset + INLINE_RESULTS_LIMIT) if len(matches) > offset + INLINE_RESULTS_LIMIT else ''
+    return results, next_offset
+
+async def inline_part_search(update: Update, context: CallbackContext):
+    """Поиск запчастей по каталогу в inline-режиме"""
+    query = update.inline_query
+    user_id = query.from_user.id
+    latest_inline_queries[user_id] = query.id
+    
+    # Запросы приходят на каждую букву: если ответа нет в кеше, ждем паузу в наборе
+    # и отвечаем только на последний запрос пользователя
+    if not part_catalog.is_cached(query.query):
+        await asyncio.sleep(INLINE_DEBOUNCE)
+        if latest_inline_queries.get(user_id) != query.id:
+            return
+    
+    try:
+        offset = int(query.offset) if query.offset.isdigit() else 0
+        results, next_offset = build_inline_results(query.query, offset)
+        await query.answer(results, cache_time=INLINE_CACHE_TIME, next_offset=next_offset)
+    finally:
+        # Запись нужна только пока запрос ждет ответа; более новый запрос удалит свою сам
+        if latest_inline_queries.get(user_id) == query.id:
+            del latest_inline_queries[user_id]
+
+async def stats_command(update: Update, context: CallbackContext):
+    """Статистика заявок для администратора"""
+    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+        return
+    
+    funnel_order = [STATE_NAMES[state] for state in FUNNEL_STATES]
+    await update.message.reply_text(live_stats.report(funnel_order))
+
+async def save_stats_periodically():
+    """Периодически сохранять счетчики статистики"""
+    while True:
+        await asyncio.sleep(STATS_SAVE_INTERVAL)
+        live_stats.save()
+
 async def error_handler(update: Update, context: CallbackContext):
     """Обработчик ошибок"""
     logger.error(f"Ошибка: {context.error}", exc_info=context.error)
@@ -619,8 +865,149 @@ async def error_handler(update: Update, context: CallbackContext):
             reply_markup=ReplyKeyboardRemove()
         )
 
+async def post_init(application: Application):
+    """Подготовка данных после запуска приложения"""
+    inline_result_filter.add_usernames(application.bot.username)
+    background_tasks.append(asyncio.create_task(refresh_crossref_periodically()))
+    live_stats.load()
+    background_tasks.append(asyncio.create_task(save_stats_periodically()))
+    await asyncio.to_thread(part_catalog.load)
+
+async def post_shutdown(application: Application):
+    """Сохранение данных при остановке бота"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    live_stats.save()
+    if traffic_recorder:
+        traffic_recorder.close()
+
+def build_application(request=None, get_updates_request=None):
+    """Создание Application со всеми обработчиками"""
+    # Создаем Application
+    builder = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if request:
+        builder = builder.request(request)
+    if get_updates_request:
+        builder = builder.get_updates_request(get_updates_request)
+    application = builder.build()
+    
+    # Выбранный inline-результат проверяется раньше текстовых обработчиков каждого шага:
+    # на шагах с запчастями он добавляется в заявку, на остальных бот объясняет, где его выбрать
+    add_catalog_part_handler = MessageHandler(inline_result_filter & filters.TEXT, add_catalog_part)
+    decline_catalog_part_handler = MessageHandler(inline_result_filter, decline_catalog_part)
+    
+    # Настраиваем обработчики
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler('start', start)],
+        states={
+            CITY: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_city),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            CAR_BRAND: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_car_brand),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            CAR_MODEL: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_car_model),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            CAR_YEAR: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_car_year),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            VIN_OR_STS: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_vin_choice),
+                MessageHandler(filters.PHOTO, handle_vin_photo),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            VIN_TEXT: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_vin_text),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            ENGINE_VOLUME: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_engine_volume),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            ENGINE_FUEL: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_fuel_type),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            PART_MAIN: [
+                add_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_part_main),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            PART_REFINEMENT: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_part_refinement),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            PART_SPECIFICS: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_part_specifics),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            PART_PHOTO: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_part_photo),
+                MessageHandler(filters.PHOTO, handle_part_photo),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            MORE_PARTS: [
+                add_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_more_parts),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            CONTACT_INFO: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_contact_info),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            CONFIRMATION: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_confirmation),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+            EDIT_CHOICE: [
+                decline_catalog_part_handler,
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_edit_choice),
+                MessageHandler(filters.ALL, fallback_handler)
+            ],
+        },
+        fallbacks=[
+            CommandHandler('start', start),
+            CommandHandler('cancel', cancel),
+            MessageHandler(filters.ALL, fallback_handler)
+        ],
+        allow_reentry=True
+    )
+    
+    # Команда /stats регистрируется раньше диалога, чтобы ее не перехватили его обработчики
+    application.add_handler(CommandHandler('stats', stats_command))
+    application.add_handler(conv_handler)
+    # Inline-поиск отвечает с паузой, поэтому не должен задерживать остальные апдейты
+    application.add_handler(InlineQueryHandler(inline_part_search, block=False))
+    application.add_error_handler(error_handler)
+    
+    # Добавляем глобальный обработчик команды /start
+    application.add_handler(CommandHandler("start", start))
+    
+    return application
+
 def main():
     """Запуск бота"""
+    global traffic_recorder
     if not BOT_TOKEN:
         logger.error("❌ Ошибка: BOT_TOKEN не установлен!")
         return
@@ -628,93 +1015,15 @@ def main():
     logger.info(f"🔍 ADMIN_CHAT_ID: {ADMIN_CHAT_ID}")
     
     try:
-        # Создаем Application
-        application = Application.builder().token(BOT_TOKEN).build()
-        
-        # Настраиваем обработчики
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler('start', start)],
-            states={
-                CITY: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_city),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                CAR_BRAND: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_car_brand),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                CAR_MODEL: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_car_model),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                CAR_YEAR: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_car_year),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                VIN_OR_STS: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_vin_choice),
-                    MessageHandler(filters.PHOTO, handle_vin_photo),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                VIN_TEXT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_vin_text),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                ENGINE_VOLUME: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_engine_volume),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                ENGINE_FUEL: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_fuel_type),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                PART_MAIN: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_part_main),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                PART_REFINEMENT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_part_refinement),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                PART_SPECIFICS: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_part_specifics),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                PART_PHOTO: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_part_photo),
-                    MessageHandler(filters.PHOTO, handle_part_photo),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                MORE_PARTS: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_more_parts),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                CONTACT_INFO: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, get_contact_info),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                CONFIRMATION: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_confirmation),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-                EDIT_CHOICE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_edit_choice),
-                    MessageHandler(filters.ALL, fallback_handler)
-                ],
-            },
-            fallbacks=[
-                CommandHandler('start', start),
-                CommandHandler('cancel', cancel),
-                MessageHandler(filters.ALL, fallback_handler)
-            ],
-            allow_reentry=True
-        )
-        
-        application.add_handler(conv_handler)
-        application.add_error_handler(error_handler)
+        request, get_updates_request = None, None
+        if RECORD_FILE:
+            scrubber = Scrubber(RECORD_SALT, keep_ids=[ADMIN_CHAT_ID], document_prompts=[VIN_TEXT_PROMPT])
+            traffic_recorder = Recorder(RECORD_FILE, scrubber)
+            request = RecordingRequest(HTTPXRequest(connection_pool_size=256), traffic_recorder)
+            get_updates_request = RecordingRequest(HTTPXRequest(), traffic_recorder)
+            logger.info(f"🔍 Запись трафика в {RECORD_FILE}")
         
-        # Добавляем глобальный обработчик команды /start
-        application.add_handler(CommandHandler("start", start))
+        application = build_application(request, get_updates_request)
         
         # Запускаем бота
         logger.info("🤖 Бот 'АвтоЗапчасти 24/7' запущен...")
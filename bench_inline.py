@@ -0,0 +1,138 @@
+"""Замер задержки inline-поиска при потоке запросов с частотой набора текста.
+
+Каждый пользователь набирает название запчасти по одной букве с заданным
+темпом, запросы разных пользователей перемешаны во времени. Апдейты идут
+через Application с обработчиком inline_part_search, поэтому в задержку
+входят очередь апдейтов, пауза debounce, поиск, сборка результатов и вызов
+answerInlineQuery. Меряется время от прихода запроса до ответа на него;
+запросы, вытесненные следующей буквой, не отвечаются и считаются отдельно.
+
+    python bench_inline.py --items 50000 --users 200 --key-interval 0.15
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault('BOT_TOKEN', '123456:bench')
+
+from telegram import Update
+
+import app
+from replay import FakeBotRequest
+
+WORDS = [
+    'колодки', 'тормозные', 'передние', 'задние', 'фильтр', 'масляный', 'воздушный', 'салонный',
+    'топливный', 'амортизатор', 'стойка', 'стабилизатора', 'рычаг', 'подвески', 'ремень', 'грм',
+    'ролик', 'натяжителя', 'помпа', 'радиатор', 'свеча', 'зажигания', 'катушка', 'датчик',
+    'кислорода', 'лампа', 'фара', 'левая', 'правая', 'диск', 'сцепления', 'подшипник', 'ступицы',
+]
+
+
+class TimedBotRequest(FakeBotRequest):
+    """Запоминает момент ответа на каждый inline-запрос"""
+
+    def __init__(self, latency: float = 0):
+        super().__init__(latency)
+        self.answered = {}
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        result = await super().do_request(url, method, request_data, *args, **kwargs)
+        if url.endswith('/answerInlineQuery'):
+            self.answered[request_data.parameters['inline_query_id']] = time.perf_counter()
+        return result
+
+
+def make_catalog(path: str, items: int, rng: random.Random):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(items):
+            name = ' '.join(rng.sample(WORDS, rng.randint(2, 4)))
+            f.write(f"{name};{rng.randint(10000, 99999)}-{i:05d}\n")
+
+
+def make_flood(users: int, duration: float, key_interval: float, rng: random.Random) -> list:
+    """Запросы (время от начала, пользователь, текст) в порядке прихода"""
+    flood = []
+    for user in range(1, users + 1):
+        text = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        at = rng.uniform(0, duration)
+        for i in range(1, len(text) + 1):
+            flood.append((at, user, text[:i]))
+            at += rng.uniform(0.5, 1.5) * key_interval
+    flood.sort()
+    return flood
+
+
+async def run(flood: list, latency: float, run_id: int) -> tuple:
+    fake = TimedBotRequest(latency)
+    application = app.build_application(fake, fake)
+    await application.initialize()
+    await application.start()
+
+    arrived = {}
+    started = time.perf_counter()
+    for n, (at, user, text) in enumerate(flood):
+        delay = at - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        query_id = f"{run_id}-{n}"
+        update = Update.de_json({
+            'update_id': n,
+            'inline_query': {
+                'id': query_id,
+                'from': {'id': user, 'is_bot': False, 'first_name': 'bench'},
+                'query': text,
+                'offset': '',
+            },
+        }, application.bot)
+        arrived[query_id] = time.perf_counter()
+        await application.update_queue.put(update)
+
+    # stop() дожидается неблокирующих обработчиков, но только уже запущенных
+    await application.update_queue.join()
+    await application.stop()
+    await application.shutdown()
+    return [fake.answered[q] - arrived[q] for q in fake.answered], len(arrived)
+
+
+def report(title: str, latencies: list, total: int):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{title}: запросов {total}, отвечено {len(latencies)}, "
+          f"p50 {statistics.median(latencies) * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс, "
+          f"макс. {latencies[-1] * 1000:.1f} мс")
+
+
+async def bench(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.part_catalog.path = os.path.join(tmp, 'catalog.csv')
+        make_catalog(app.part_catalog.path, args.items, rng)
+        app.part_catalog.load()
+
+    flood = make_flood(args.users, args.duration, args.key_interval, rng)
+    report("Холодный кеш", *await run(flood, args.latency, 1))
+    report("Повтор того же потока", *await run(flood, args.latency, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк inline-поиска по каталогу")
+    parser.add_argument('--items', type=int, default=50000, help="позиций в каталоге")
+    parser.add_argument('--users', type=int, default=200, help="пользователей, печатающих запрос")
+    parser.add_argument('--duration', type=float, default=10,
+                        help="за сколько секунд пользователи начинают набор")
+    parser.add_argument('--key-interval', type=float, default=0.15,
+                        help="средняя пауза между буквами в секундах")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="имитация задержки Bot API в секундах")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(bench(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import logging
+import os
+import re
+from array import array
+from collections import OrderedDict
+
+from crossref import normalize_article
+
+logger = logging.getLogger(__name__)
+
+_SEPARATORS = re.compile(r'[;\t|]')
+
+# Сколько индексов позиций всего хранит кеш выдачи (по 4 байта на индекс)
+MAX_CACHED_INDICES = 1_000_000
+
+
+def normalize_query(text: str) -> str:
+    """Приводит запрос к виду ключа кеша: без регистра, ё и лишних пробелов"""
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+class PartCatalog:
+    """Каталог запчастей для inline-поиска.
+
+    Результат запроса — все позиции, в названии или артикуле которых есть
+    каждое слово запроса. Поэтому выдача для "колодки пер" всегда входит
+    в выдачу для "колодки пе", и при наборе очередной буквы достаточно
+    отфильтровать результат предыдущего префикса из LRU-кеша.
+
+    Кеш ограничен и числом запросов, и суммарным размером выдач: выдача
+    больше четверти max_cached_indices не кешируется, чтобы одна короткая
+    выдача на большом каталоге не вытесняла все остальные.
+    """
+
+    def __init__(self, path: str, cache_size: int = 4096, max_cached_indices: int = MAX_CACHED_INDICES):
+        self.path = path
+        self.cache_size = cache_size
+        self.max_cached_indices = max_cached_indices
+        self._cached_indices = 0
+        self.entries = []
+        self._search_keys = []
+        self._by_message = {}
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        """Загрузить каталог из файла "название;артикул" """
+        if not os.path.exists(self.path):
+            return
+
+        entries = []
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    fields = [x.strip() for x in _SEPARATORS.split(line)]
+                    name = fields[0]
+                    article = fields[1] if len(fields) > 1 else ''
+                    if name:
+                        entries.append((name, article))
+        except OSError as e:
+            logger.error(f"Ошибка загрузки каталога {self.path}: {e}")
+            return
+
+        self.entries = entries
+        self._search_keys = [
+            normalize_query(f"{name} {article} {normalize_article(article)}") for name, article in entries
+        ]
+        self._by_message = {self.message_text(i): i for i in range(len(entries))}
+        self._cache.clear()
+        self._cached_indices = 0
+        logger.info(f"✅ Каталог загружен: позиций {len(entries)}")
+
+    def message_text(self, idx: int) -> str:
+        """Текст сообщения, которое отправляется в чат при выборе позиции"""
+        name, article = self.entries[idx]
+        return f"🔧 {name}\nАртикул: {article}" if article else f"🔧 {name}"
+
+    def find_by_message(self, text: str):
+        """Позиция каталога, выбранная через inline-поиск, или None"""
+        idx = self._by_message.get(text)
+        return None if idx is None else self.entries[idx]
+
+    def is_cached(self, query: str) -> bool:
+        key = normalize_query(query)
+        return not key or key in self._cache
+
+    def search(self, query: str):
+        """Индексы всех подходящих позиций в порядке каталога"""
+        key = normalize_query(query)
+        if not key:
+            return range(len(self.entries))
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        # Сужаем выдачу самого длинного закешированного префикса
+        candidates = range(len(self.entries))
+        for end in range(len(key) - 1, 0, -1):
+            prefix_result = self._cache.get(key[:end])
+            if prefix_result is not None:
+                candidates = prefix_result
+                break
+
+        words = key.split()
+        keys = self._search_keys
+        if len(words) == 1:
+            word = words[0]
+            result = array('i', [i for i in candidates if word in keys[i]])
+        else:
+            result = array('i', [i for i in candidates if all(w in keys[i] for w in words)])
+
+        if len(result) <= self.max_cached_indices // 4:
+            self._cache[key] = result
+            self._cached_indices += len(result)
+            while len(self._cache) > self.cache_size or self._cached_indices > self.max_cached_indices:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_indices -= len(evicted)
+        return result
@@ -0,0 +1,308 @@
+import contextlib
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# Кириллические буквы, которые выглядят как латинские и часто попадают в артикулы
+_LOOKALIKES = str.maketrans('АВЕКМНОРСТХУ', 'ABEKMHOPCTXY')
+_NON_ALNUM = re.compile(r'[^0-9A-ZА-ЯЁ]')
+_SEPARATORS = re.compile(r'[;,\t|]')
+
+MIN_ARTICLE_LENGTH = 4
+# Файл без перевода строки в конце считается дописанным, если не менялся столько секунд
+FILE_SETTLE_SECONDS = 2
+# Сколько байт перед прочитанной позицией сверяется, чтобы заметить перезапись файла
+FINGERPRINT_BYTES = 64
+
+_EMPTY = -1
+
+
+def normalize_article(article: str) -> str:
+    """Приводит артикул к единому виду: 04465-33450 и 0446533450 совпадают"""
+    return _NON_ALNUM.sub('', article.upper().translate(_LOOKALIKES))
+
+
+def _looks_like_article(article: str) -> bool:
+    return len(article) >= MIN_ARTICLE_LENGTH and any(ch.isdigit() for ch in article)
+
+
+def extract_articles(text: str) -> list:
+    """Достает из свободного текста все похожие на артикул номера"""
+    tokens = [normalize_article(t) for t in re.split(r'[\s,;]+', text)]
+    candidates = list(tokens)
+    # Номер может быть записан с пробелами: "0446 533 450" — склеиваем соседние числовые куски
+    run = []
+    for token in tokens + ['']:
+        if token and any(ch.isdigit() for ch in token):
+            run.append(token)
+            continue
+        if len(run) > 1:
+            candidates.append(''.join(run))
+        run = []
+
+    articles = []
+    for article in candidates:
+        if _looks_like_article(article) and article not in articles:
+            articles.append(article)
+    return articles
+
+
+class _Storage:
+    """Компактное хранилище групп аналогов.
+
+    Артикулы лежат подряд в одном bytearray, границы — в массиве offsets,
+    поиск по артикулу — открытая адресация в массиве table. Группы хранятся
+    в системе непересекающихся множеств: parent/size — для объединения,
+    next — кольцевой список членов группы, чтобы перечислить аналоги
+    без обхода всего индекса.
+
+    add сам таблицу не расширяет: перед добавлением место резервируется
+    через grown_table, чтобы большую таблицу можно было собрать без
+    блокировки и подменить одним присваиванием.
+    """
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = array('q', [0])
+        self.table = array('i', [_EMPTY]) * 1024
+        self.parent = array('i')
+        self.size = array('i')
+        self.next = array('i')
+
+    def __len__(self):
+        return len(self.parent)
+
+    def key(self, idx: int) -> str:
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].decode('utf-8')
+
+    def _slot(self, key: bytes) -> int:
+        """Ячейка таблицы с этим артикулом или первая пустая на его пути"""
+        table, blob, offsets = self.table, self.blob, self.offsets
+        mask = len(table) - 1
+        slot = hash(key) & mask
+        while True:
+            idx = table[slot]
+            if idx == _EMPTY or blob[offsets[idx]:offsets[idx + 1]] == key:
+                return slot
+            slot = (slot + 1) & mask
+
+    def lookup(self, article: str) -> int:
+        return self.table[self._slot(article.encode('utf-8'))]
+
+    def add(self, article: str) -> int:
+        key = article.encode('utf-8')
+        slot = self._slot(key)
+        idx = self.table[slot]
+        if idx != _EMPTY:
+            return idx
+
+        idx = len(self.parent)
+        self.blob += key
+        self.offsets.append(len(self.blob))
+        self.parent.append(idx)
+        self.size.append(1)
+        self.next.append(idx)
+        self.table[slot] = idx
+        return idx
+
+    def grown_table(self, extra: int):
+        """Новая таблица побольше, если с extra артикулами текущая заполнится больше чем наполовину.
+
+        Само хранилище не меняется, поэтому читать его можно параллельно.
+        """
+        size = len(self.table)
+        while (len(self.parent) + extra) * 2 > size:
+            size *= 2
+        if size == len(self.table):
+            return None
+
+        table = array('i', [_EMPTY]) * size
+        blob, offsets = self.blob, self.offsets
+        mask = size - 1
+        for idx in range(len(self.parent)):
+            slot = hash(bytes(blob[offsets[idx]:offsets[idx + 1]])) & mask
+            while table[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            table[slot] = idx
+        return table
+
+    def find(self, idx: int) -> int:
+        parent = self.parent
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        # Склеиваем кольцевые списки обменом указателей
+        self.next[root_a], self.next[root_b] = self.next[root_b], self.next[root_a]
+
+
+class CrossReferenceIndex:
+    """Индекс групп аналогов OEM ↔ aftermarket из файлов папки directory.
+
+    Новые файлы и дописанные строки подгружаются инкрементально. Если файл
+    перезаписан или удален, индекс собирается заново в фоне и подменяется
+    целиком: объединения групп в системе непересекающихся множеств
+    отменить нельзя.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.ready = False
+        self._storage = _Storage()
+        # Состояние прочитанных файлов: inode, mtime, размер, позиция и отпечаток перед ней
+        self._files = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._storage)
+
+    def add_group(self, articles):
+        """Объединяет переданные артикулы в одну группу аналогов"""
+        self._add_group(self._storage, articles)
+
+    def _add_group(self, storage: _Storage, articles):
+        articles = [a for a in (normalize_article(x) for x in articles) if a]
+        # Таблица растет вне блокировки: analogs() в это время читает старую
+        table = storage.grown_table(len(articles))
+        # Хранилище, которое собирается заново, никто кроме refresh не читает
+        lock = self._lock if storage is self._storage else contextlib.nullcontext()
+        with lock:
+            if table is not None:
+                storage.table = table
+            ids = [storage.add(a) for a in articles]
+            for idx in ids[1:]:
+                storage.union(ids[0], idx)
+
+    def _add_line(self, storage: _Storage, raw_line: bytes):
+        line = raw_line.decode('utf-8', errors='ignore').strip()
+        if line and not line.startswith('#'):
+            self._add_group(storage, _SEPARATORS.split(line))
+
+    def _load_file(self, storage: _Storage, path: str, st, state) -> dict:
+        """Дочитывает файл с сохраненной позиции и возвращает его новое состояние"""
+        offset = state['offset'] if state else 0
+        settled = (time.time() - st.st_mtime > FILE_SETTLE_SECONDS
+                   or (state is not None and state['mtime'] == st.st_mtime_ns
+                       and state['size'] == st.st_size))
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n') and not settled:
+                    # Строка еще дописывается — дочитаем при следующем обновлении
+                    break
+                offset += len(raw_line)
+                self._add_line(storage, raw_line)
+            f.seek(max(offset - FINGERPRINT_BYTES, 0))
+            fingerprint = f.read(min(offset, FINGERPRINT_BYTES))
+        return {'ino': st.st_ino, 'mtime': st.st_mtime_ns, 'size': st.st_size,
+                'offset': offset, 'fingerprint': fingerprint}
+
+    @staticmethod
+    def _replaced(path: str, st, state: dict) -> bool:
+        """Файл подменен или переписан, а не просто дописан"""
+        if st.st_ino != state['ino'] or st.st_size < state['offset']:
+            return True
+        if st.st_mtime_ns == state['mtime']:
+            return False
+        fingerprint = state['fingerprint']
+        with open(path, 'rb') as f:
+            f.seek(state['offset'] - len(fingerprint))
+            return f.read(len(fingerprint)) != fingerprint
+
+    def _list_files(self) -> dict:
+        if not os.path.isdir(self.directory):
+            return {}
+        files = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(('.csv', '.txt')):
+                path = os.path.join(self.directory, name)
+                try:
+                    files[path] = os.stat(path)
+                except OSError as e:
+                    logger.error(f"Ошибка чтения файла кросс-номеров {path}: {e}")
+        return files
+
+    def refresh(self) -> int:
+        """Подгружает новые файлы и дописанные строки существующих.
+
+        Возвращает количество файлов, из которых были прочитаны данные.
+        """
+        with self._refresh_lock:
+            files = self._list_files()
+            try:
+                rebuild = any(
+                    path not in files or self._replaced(path, files[path], state)
+                    for path, state in self._files.items()
+                )
+            except OSError:
+                rebuild = True
+
+            storage = _Storage() if rebuild else self._storage
+            states = {} if rebuild else dict(self._files)
+            updated = 0
+            for path, st in files.items():
+                state = states.get(path)
+                if state and state['offset'] == st.st_size:
+                    continue
+                try:
+                    states[path] = self._load_file(storage, path, st, state)
+                except OSError as e:
+                    logger.error(f"Ошибка чтения файла кросс-номеров {path}: {e}")
+                    continue
+                if states[path]['offset'] != (state['offset'] if state else 0):
+                    updated += 1
+
+            with self._lock:
+                self._storage = storage
+                self._files = states
+            self.ready = True
+
+        if updated or rebuild:
+            logger.info(f"✅ Кросс-номера обновлены: файлов {updated}, артикулов {len(self)}")
+        return updated
+
+    def group(self, article: str):
+        """Номер группы аналогов артикула или None, если артикул неизвестен.
+
+        Номер одинаков для всех артикулов группы до следующего обновления индекса.
+        """
+        if not self.ready:
+            return None
+        with self._lock:
+            idx = self._storage.lookup(normalize_article(article))
+            return None if idx == _EMPTY else self._storage.find(idx)
+
+    def analogs(self, article: str, limit: int = 100) -> list:
+        """Аналоги артикула (без него самого), не больше limit штук.
+
+        Пока индекс не загружен первый раз, возвращает пустой список.
+        """
+        if not self.ready:
+            return []
+        with self._lock:
+            storage = self._storage
+            idx = storage.lookup(normalize_article(article))
+            if idx == _EMPTY:
+                return []
+
+            result = []
+            member = storage.next[idx]
+            while member != idx and len(result) < limit:
+                result.append(storage.key(member))
+                member = storage.next[member]
+        return result
@@ -0,0 +1,337 @@
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+# Служебные запросы, которые не относятся к логике обработчиков
+INTERNAL_METHODS = {'getUpdates', 'getMe', 'deleteWebhook', 'setWebhook', 'close', 'logOut'}
+
+PHONE_RE = re.compile(r'(?:\+7|8)(?:[\s\-()]*\d){10}')
+VIN_RE = re.compile(r'\b[A-HJ-NPR-Z0-9]{17}\b', re.IGNORECASE)
+WORD_RE = re.compile(r'\w+')
+
+SCRUBBED_VIN = 'X' * 17
+
+# Сколько последних введенных VIN/СТС помнить, чтобы маскировать их в ответах бота
+MAX_REMEMBERED_DOCUMENTS = 1000
+# Записи копятся до WRITE_INTERVAL секунд или WRITE_BATCH_SIZE штук и сжимаются одним gzip-фрагментом
+WRITE_INTERVAL = 0.5
+WRITE_BATCH_SIZE = 500
+READ_CHUNK = 4096
+GZIP_MAGIC = b'\x1f\x8b\x08'
+
+# forward_origin в Bot API 7 хранит автора пересланного сообщения в sender_user/sender_chat/chat,
+# а скрытого пользователя и подпись в канале — строками
+PERSON_KEYS = ('from', 'chat', 'user', 'sender_chat', 'sender_user', 'forward_from', 'contact')
+NAME_KEYS = ('first_name', 'last_name', 'username', 'title')
+SIGNATURE_KEYS = ('sender_user_name', 'author_signature', 'forward_sender_name', 'forward_signature')
+TEXT_KEYS = ('text', 'caption', 'query')
+ID_PARAMS = ('chat_id', 'user_id')
+
+
+def _phone_key(phone: str) -> str:
+    return re.sub(r'\D', '', phone)[-10:]
+
+
+def mask_phones(text: str) -> str:
+    """Заменяет цифры телефонов нулями, сохраняя их формат для проверок бота"""
+    def mask(match):
+        phone = match.group()
+        prefix = 2 if phone.startswith('+') else 1
+        return phone[:prefix] + re.sub(r'\d', '0', phone[prefix:])
+    return PHONE_RE.sub(mask, text)
+
+
+def mask_document(text: str) -> str:
+    """Маскирует номер документа: цифры заменяются нулями, буквы — X"""
+    return re.sub(r'[^\W_]', lambda m: '0' if m.group().isdigit() else 'X', text)
+
+
+class Scrubber:
+    """Удаляет персональные данные из апдейтов и запросов к Bot API.
+
+    Телефоны и VIN маскируются, идентификаторы и имена заменяются
+    стабильными псевдонимами, поэтому диалог одного пользователя
+    в записи остается связным. Псевдонимы зависят от соли: с одной и той же
+    RECORD_SALT записи разных запусков совпадают между собой.
+
+    Номер СТС не отличить от артикула по виду, поэтому ответ пользователя
+    маскируется целиком, если перед ним бот отправил в этот чат один из
+    document_prompts.
+    """
+
+    def __init__(self, salt: bytes, keep_ids=(), document_prompts=()):
+        self.salt = salt
+        self.keep_ids = {str(i) for i in keep_ids}
+        self.document_prompts = tuple(document_prompts)
+        # Имена клиентов по номеру телефона: имя заменяется в тех текстах, где есть его телефон
+        self._contacts = {}
+        # Чаты, от которых ждем VIN/СТС, и уже введенные номера документов
+        self._awaiting_document = set()
+        self._documents = OrderedDict()
+
+    def _digest(self, value) -> str:
+        return hmac.new(self.salt, str(value).encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _pseudo_name(self, name: str) -> str:
+        return 'name_' + self._digest(name)[:6]
+
+    def pseudo_id(self, value):
+        if str(value) in self.keep_ids:
+            return value
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            return value
+        pseudo = int(self._digest(number)[:12], 16) % 10**9 + 10**9
+        return -pseudo if number < 0 else pseudo
+
+    def scrub_text(self, text: str) -> str:
+        phones = list(PHONE_RE.finditer(text))
+        if len(phones) == 1 and not text[phones[0].end():].strip():
+            # Контакты вводятся как "Имя телефон" — имя тоже считаем персональным
+            words = WORD_RE.findall(text[:phones[0].start()])
+            if 0 < len(words) <= 3:
+                self._contacts[_phone_key(phones[0].group())] = words
+
+        names = [w for m in phones for w in self._contacts.get(_phone_key(m.group()), ())]
+        text = mask_phones(text)
+        text = VIN_RE.sub(SCRUBBED_VIN, text)
+        for document, masked in self._documents.items():
+            if document in text:
+                text = text.replace(document, masked)
+        if names:
+            names_re = re.compile(r'\b(?:' + '|'.join(map(re.escape, names)) + r')\b')
+            text = names_re.sub(lambda m: self._pseudo_name(m.group()), text)
+        return text
+
+    def _scrub_person(self, person: dict) -> dict:
+        person = dict(person)
+        if 'id' in person:
+            person['id'] = self.pseudo_id(person['id'])
+        for key in NAME_KEYS:
+            if isinstance(person.get(key), str):
+                person[key] = self._pseudo_name(person[key])
+        if 'vcard' in person:
+            person['vcard'] = ''
+        return person
+
+    def watch_call(self, params: dict):
+        """Запоминает чаты, которым бот только что задал вопрос про VIN/СТС"""
+        chat_id, text = str(params.get('chat_id')), params.get('text')
+        if isinstance(text, str) and any(prompt in text for prompt in self.document_prompts):
+            self._awaiting_document.add(chat_id)
+        else:
+            self._awaiting_document.discard(chat_id)
+
+    def scrub_update(self, update: dict) -> dict:
+        """Копия апдейта без персональных данных, включая ответ с номером документа"""
+        message = update.get('message') or {}
+        chat_id = str((message.get('chat') or {}).get('id'))
+        if chat_id in self._awaiting_document and isinstance(message.get('text'), str):
+            self._awaiting_document.discard(chat_id)
+            document = message['text'].strip()
+            if document:
+                self._documents[document] = mask_document(document)
+                if len(self._documents) > MAX_REMEMBERED_DOCUMENTS:
+                    self._documents.popitem(last=False)
+        return self.scrub(update)
+
+    def scrub(self, data):
+        """Копия апдейта или параметров запроса без персональных данных"""
+        if isinstance(data, list):
+            return [self.scrub(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for key, value in data.items():
+            if key in PERSON_KEYS and isinstance(value, dict):
+                result[key] = self.scrub(self._scrub_person(value))
+            elif key in ID_PARAMS:
+                result[key] = self.pseudo_id(value)
+            elif key == 'phone_number' and isinstance(value, str):
+                masked = mask_phones(value)
+                result[key] = masked if masked != value else re.sub(r'\d', '0', value)
+            elif key in SIGNATURE_KEYS and isinstance(value, str):
+                result[key] = self._pseudo_name(value)
+            elif key in TEXT_KEYS and isinstance(value, str):
+                result[key] = self.scrub_text(value)
+            else:
+                result[key] = self.scrub(value)
+        return result
+
+
+class Recorder:
+    """Пишет апдейты и вызовы Bot API в сжатый JSONL-журнал только на дозапись.
+
+    Очистка, сжатие и запись идут в отдельном потоке, чтобы не искажать
+    время работы обработчиков. Каждая пачка записей — самостоятельный
+    gzip-фрагмент, поэтому обрыв при падении портит только последнюю пачку,
+    а следующий запуск дописывает файл с чистого фрагмента.
+    """
+
+    def __init__(self, path: str, scrubber: Scrubber):
+        self.path = path
+        self.scrubber = scrubber
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self._thread.start()
+
+    def record_update(self, update: dict):
+        self._queue.put(('update', time.time(), update))
+
+    def record_call(self, method: str, params: dict, ok: bool, duration: float):
+        self._queue.put(('call', time.time(), (method, params, ok, duration)))
+
+    def record_bot(self, bot: dict):
+        """Запоминает, от имени какого бота идет запись (ответ getMe)"""
+        self._queue.put(('bot', time.time(), bot))
+
+    def _encode(self, item) -> bytes:
+        kind, ts, payload = item
+        if kind == 'update':
+            record = {'type': 'update', 'update': self.scrubber.scrub_update(payload)}
+        elif kind == 'bot':
+            # Имя бота нужно при воспроизведении, чтобы узнать выбор из его inline-режима
+            record = {'type': 'bot', 'bot': payload}
+        else:
+            method, params, ok, duration = payload
+            self.scrubber.watch_call(params)
+            record = {
+                'type': 'call',
+                'method': method,
+                'params': self.scrubber.scrub(params),
+                'ok': ok,
+                'ms': round(duration * 1000, 3),
+            }
+        record['ts'] = ts
+        return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_INTERVAL
+            while batch[-1] is not None and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            lines = []
+            for item in batch:
+                if item is None:
+                    stopped = True
+                    continue
+                try:
+                    lines.append(self._encode(item))
+                except Exception as e:
+                    logger.error(f"Ошибка записи трафика: {e}")
+            if lines:
+                try:
+                    self._file.write(gzip.compress(b''.join(lines)))
+                    self._file.flush()
+                except OSError as e:
+                    logger.error(f"Ошибка записи трафика в {self.path}: {e}")
+
+    def close(self):
+        """Дописать накопленные записи и закрыть журнал"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+
+
+def _read_members(data: bytes):
+    """Распаковывает gzip-фрагменты подряд, пропуская поврежденные"""
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        chunks = []
+        feed = pos
+        try:
+            while not decompressor.eof and feed < len(data):
+                chunks.append(decompressor.decompress(view[feed:feed + READ_CHUNK]))
+                feed += READ_CHUNK
+        except zlib.error:
+            pass
+        if not decompressor.eof:
+            # Фрагмент оборван при падении: ищем начало следующего
+            logger.warning(f"Поврежденный фрагмент журнала на позиции {pos} пропущен")
+            next_member = data.find(GZIP_MAGIC, pos + 1)
+            if next_member == -1:
+                return
+            pos = next_member
+            continue
+        yield b''.join(chunks)
+        pos = min(feed, len(data)) - len(decompressor.unused_data)
+
+
+def read_recording(path: str):
+    """Читает записи журнала; поврежденные при падении фрагменты пропускаются"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for chunk in _read_members(data):
+        for line in chunk.splitlines():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class RecordingRequest(BaseRequest):
+    """Обертка над сетевым слоем бота, которая записывает трафик в Recorder"""
+
+    def __init__(self, request: BaseRequest, recorder: Recorder):
+        self._request = request
+        self._recorder = recorder
+
+    @property
+    def read_timeout(self):
+        return self._request.read_timeout
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        code, payload = await self._request.do_request(url, method, request_data, *args, **kwargs)
+        duration = time.perf_counter() - started
+
+        try:
+            if api_method == 'getUpdates':
+                if code == 200:
+                    for update in json.loads(payload).get('result', []):
+                        self._recorder.record_update(update)
+            elif api_method == 'getMe':
+                if code == 200:
+                    self._recorder.record_bot(json.loads(payload)['result'])
+            elif api_method not in INTERNAL_METHODS:
+                params = request_data.parameters if request_data else {}
+                self._recorder.record_call(api_method, params, code == 200, duration)
+        except ValueError as e:
+            logger.error(f"Ошибка записи трафика: {e}")
+
+        return code, payload
@@ -0,0 +1,264 @@
+"""Воспроизведение записанного трафика бота для проверки скорости и поведения.
+
+Запись делается ботом при заданной переменной RECORD_FILE. Пример:
+
+    python replay.py recordings/traffic.jsonl.gz --speed 0 --json report.json
+
+--speed 1 воспроизводит апдейты с исходными паузами, --speed 0 — без пауз.
+При ускоренном воспроизведении отложенные напоминания не успевают сработать
+и попадают в расхождения.
+"""
+import argparse
+import asyncio
+import difflib
+import functools
+import json
+import logging
+import os
+import re
+import statistics
+import time
+
+os.environ.setdefault('BOT_TOKEN', '123456:replay')
+
+from telegram import Update
+from telegram.ext import ConversationHandler
+from telegram.request import BaseRequest
+
+import app
+from recorder import INTERNAL_METHODS, SCRUBBED_VIN, VIN_RE, mask_phones, read_recording
+
+logger = logging.getLogger(__name__)
+
+ORDER_ID_RE = re.compile(r'#\d{9,}')
+
+DEFAULT_BOT = {'id': 1, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+
+
+class FakeBotRequest(BaseRequest):
+    """Локальная замена Bot API: отвечает на запросы без сети и запоминает их"""
+
+    def __init__(self, latency: float = 0, bot: dict = None):
+        self.latency = latency
+        self.bot = bot or DEFAULT_BOT
+        self.calls = []
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'photo' in params:
+            message['photo'] = [{'file_id': params['photo'], 'file_unique_id': 'replay',
+                                 'width': 1, 'height': 1}]
+            message['caption'] = params.get('caption')
+        return message
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == 'getMe':
+            return self.bot
+        if api_method in ('sendMessage', 'sendPhoto'):
+            return self._message(params)
+        if api_method == 'getFile':
+            return {'file_id': params['file_id'], 'file_unique_id': 'replay',
+                    'file_size': 0, 'file_path': 'replay.jpg'}
+        return True
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if api_method not in INTERNAL_METHODS:
+            self.calls.append({'method': api_method, 'params': params})
+        payload = {'ok': True, 'result': self._result(api_method, params)}
+        return 200, json.dumps(payload).encode('utf-8')
+
+
+def _iter_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _iter_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _iter_handlers(state_handlers)
+            yield from _iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument(application, timings: dict):
+    """Подменяет колбэки обработчиков на обертки, замеряющие время"""
+    def timed(callback):
+        name = getattr(callback, '__name__', repr(callback))
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                timings.setdefault(name, []).append(time.perf_counter() - started)
+        wrapper.replay_timed = True
+        return wrapper
+
+    for handlers in application.handlers.values():
+        for handler in _iter_handlers(handlers):
+            if not getattr(handler.callback, 'replay_timed', False):
+                handler.callback = timed(handler.callback)
+
+
+def _call_line(call: dict) -> str:
+    """Строка для сравнения вызовов без меняющихся от запуска к запуску значений"""
+    params = dict(call['params'])
+    for key in ('text', 'caption'):
+        if isinstance(params.get(key), str):
+            # В записи телефоны и VIN замаскированы, в том числе в текстах самого бота
+            text = ORDER_ID_RE.sub('#<id>', params[key])
+            text = mask_phones(text)
+            params[key] = VIN_RE.sub(SCRUBBED_VIN, text)
+    return f"{call['method']} {json.dumps(params, ensure_ascii=False, sort_keys=True)}"
+
+
+def recorded_bot(records: list) -> tuple:
+    """Бот из записи и имена ботов, чей inline-выбор считать своим.
+
+    В старых записях ответа getMe нет — тогда своими считаются все боты
+    из via_bot записанных сообщений.
+    """
+    bots = [r['bot'] for r in records if r['type'] == 'bot']
+    if bots:
+        return bots[-1], []
+    usernames = {
+        r['update']['message']['via_bot'].get('username')
+        for r in records
+        if r['type'] == 'update' and 'via_bot' in (r['update'].get('message') or {})
+    }
+    if usernames:
+        logger.warning(f"В записи нет данных бота, inline-выбор берется из via_bot: {sorted(usernames)}")
+    return None, sorted(u for u in usernames if u)
+
+
+def _percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def timing_report(timings: dict) -> dict:
+    report = {}
+    for name, values in timings.items():
+        report[name] = {
+            'count': len(values),
+            'mean_ms': statistics.fmean(values) * 1000,
+            'p50_ms': _percentile(values, 0.5) * 1000,
+            'p95_ms': _percentile(values, 0.95) * 1000,
+            'p99_ms': _percentile(values, 0.99) * 1000,
+            'max_ms': max(values) * 1000,
+            'total_ms': sum(values) * 1000,
+        }
+    return report
+
+
+async def replay(path: str, speed: float, latency: float) -> dict:
+    records = list(read_recording(path))
+    updates = [r for r in records if r['type'] == 'update']
+    recorded_calls = [r for r in records if r['type'] == 'call']
+
+    app.crossref_index.refresh()
+    app.part_catalog.load()
+    bot, via_bot_usernames = recorded_bot(records)
+    fake = FakeBotRequest(latency, bot)
+    application = app.build_application(fake, fake)
+    timings = {}
+    instrument(application, timings)
+
+    await application.initialize()
+    app.inline_result_filter.add_usernames(application.bot.username)
+    if via_bot_usernames:
+        app.inline_result_filter.add_usernames(via_bot_usernames)
+    await application.start()
+    started = time.perf_counter()
+    first_ts = updates[0]['ts'] if updates else 0
+    for record in updates:
+        if speed:
+            delay = (record['ts'] - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(record['update'], application.bot)
+        update_started = time.perf_counter()
+        await application.process_update(update)
+        timings.setdefault('<update>', []).append(time.perf_counter() - update_started)
+
+    # Напоминания не должны пережить воспроизведение, а неблокирующих обработчиков
+    # дожидается stop()
+    for tasks in app.user_reminders.values():
+        for task in tasks:
+            task.cancel()
+    await application.stop()
+    elapsed = time.perf_counter() - started
+    await application.shutdown()
+
+    diff = list(difflib.unified_diff(
+        [_call_line(c) for c in recorded_calls],
+        [_call_line(c) for c in fake.calls],
+        'recorded', 'replayed', lineterm='', n=1
+    ))
+    return {
+        'updates': len(updates),
+        'elapsed_s': elapsed,
+        'recorded_calls': len(recorded_calls),
+        'replayed_calls': len(fake.calls),
+        'diff': diff,
+        'handlers': timing_report(timings),
+    }
+
+
+def print_report(report: dict, max_diff_lines: int):
+    print(f"Апдейтов: {report['updates']}, время: {report['elapsed_s']:.3f} с")
+    print(f"Вызовов Bot API: записано {report['recorded_calls']}, получено {report['replayed_calls']}")
+
+    print(f"\n{'обработчик':<28}{'кол-во':>8}{'сред.':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'макс.':>10}")
+    handlers = sorted(report['handlers'].items(), key=lambda item: item[1]['total_ms'], reverse=True)
+    for name, t in handlers:
+        print(f"{name:<28}{t['count']:>8}{t['mean_ms']:>10.3f}{t['p50_ms']:>10.3f}"
+              f"{t['p95_ms']:>10.3f}{t['p99_ms']:>10.3f}{t['max_ms']:>10.3f}")
+
+    if report['diff']:
+        print(f"\nРасхождения с записью ({len(report['diff'])} строк):")
+        for line in report['diff'][:max_diff_lines]:
+            print(line)
+    else:
+        print("\nОтветы бота совпадают с записью")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика бота")
+    parser.add_argument('recording', help="файл записи (RECORD_FILE)")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="множитель скорости: 1 — как в записи, 0 — без пауз")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="имитация задержки Bot API в секундах")
+    parser.add_argument('--json', help="сохранить отчет в JSON")
+    parser.add_argument('--max-diff-lines', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(replay(args.recording, args.speed, args.latency))
+    print_report(report, args.max_diff_lines)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
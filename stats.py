@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Скользящие окна: название -> (ширина бакета в секундах, количество бакетов)
+WINDOWS = {
+    'hour': (60, 60),
+    'day': (60*60, 24),
+    'week': (60*60, 7*24),
+}
+
+EVENTS = ('starts', 'orders', 'reminders', 'reminder_orders')
+
+# Заявка считается пришедшей по напоминанию, если оформлена в течение суток после него
+REMINDER_ATTRIBUTION_SECONDS = 24*60*60
+
+# Сколько значений хранить в счетчиках свободного ввода (города, марки, запчасти)
+TOP_TRACKED_LIMIT = 1000
+
+
+def _key(text: str) -> str:
+    """Ключ для группировки свободного ввода: без регистра и лишних пробелов"""
+    return ' '.join(str(text).split()).lower()
+
+
+def _count(counter: Counter, key: str):
+    """Увеличивает счетчик, не давая ему расти без ограничений.
+
+    При переполнении остаются только самые частые значения: редкие
+    варианты свободного ввода в топ все равно не попадут.
+    """
+    counter[key] += 1
+    if len(counter) > TOP_TRACKED_LIMIT:
+        kept = counter.most_common(TOP_TRACKED_LIMIT // 2)
+        counter.clear()
+        counter.update(dict(kept))
+
+
+def _bounded(data: dict) -> Counter:
+    counter = Counter(data)
+    if len(counter) > TOP_TRACKED_LIMIT:
+        counter = Counter(dict(counter.most_common(TOP_TRACKED_LIMIT)))
+    return counter
+
+
+class RollingCounter:
+    """Счетчик событий за последние N бакетов.
+
+    Устаревшие бакеты обнуляются лениво при записи, поэтому добавление
+    события стоит O(1), а подсчет суммы — O(количество бакетов).
+    """
+
+    def __init__(self, bucket_seconds: int, buckets: int):
+        self.bucket_seconds = bucket_seconds
+        self.counts = [0] * buckets
+        self.slots = [-1] * buckets
+
+    def add(self, now: float, amount: int = 1):
+        slot = int(now // self.bucket_seconds)
+        i = slot % len(self.counts)
+        if self.slots[i] != slot:
+            self.slots[i] = slot
+            self.counts[i] = 0
+        self.counts[i] += amount
+
+    def total(self, now: float) -> int:
+        current = int(now // self.bucket_seconds)
+        size = len(self.counts)
+        return sum(count for count, slot in zip(self.counts, self.slots) if 0 <= current - slot < size)
+
+    def to_dict(self) -> dict:
+        return {'counts': self.counts, 'slots': self.slots}
+
+    def load(self, data: dict):
+        if len(data.get('counts', [])) == len(self.counts) == len(data.get('slots', [])):
+            self.counts = list(data['counts'])
+            self.slots = list(data['slots'])
+
+
+class LiveStats:
+    """Статистика заявок, которая обновляется на каждом событии без пересчета истории"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.totals = Counter()
+        self.windows = {
+            event: {name: RollingCounter(*params) for name, params in WINDOWS.items()}
+            for event in EVENTS
+        }
+        self.cities = Counter()
+        self.brands = Counter()
+        self.parts = Counter()
+        self.order_hours = [0] * 24
+        self.funnel = Counter()
+        # Время последнего напоминания пользователям, еще не оформившим заявку
+        self._reminded = {}
+        self._dirty = False
+
+    def _event(self, event: str, now: float = None):
+        now = time.time() if now is None else now
+        self.totals[event] += 1
+        for counter in self.windows[event].values():
+            counter.add(now)
+        self._dirty = True
+
+    def record_start(self, user_id: int):
+        # Новая сессия: старые напоминания к ее заявке отношения не имеют
+        self._reminded.pop(user_id, None)
+        self._event('starts')
+
+    def record_state(self, state_name: str):
+        """Пользователь впервые за сессию дошел до шага диалога"""
+        self.funnel[state_name] += 1
+        self._dirty = True
+
+    def record_reminder(self, user_id: int):
+        self._reminded[user_id] = time.time()
+        self._event('reminders')
+
+    def record_order(self, user_id: int, city: str, brand: str, parts: list, hour: int):
+        self._event('orders')
+        reminded_at = self._reminded.pop(user_id, None)
+        if reminded_at is not None and time.time() - reminded_at <= REMINDER_ATTRIBUTION_SECONDS:
+            self._event('reminder_orders')
+        _count(self.cities, _key(city))
+        _count(self.brands, _key(brand))
+        for part in parts:
+            _count(self.parts, _key(part['name']))
+        self.order_hours[hour] += 1
+
+    def window_totals(self, event: str, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        return {name: counter.total(now) for name, counter in self.windows[event].items()}
+
+    def report(self, funnel_order: list, top: int = 5) -> str:
+        """Текст отчета для команды /stats"""
+        def windows_line(event):
+            w = self.window_totals(event)
+            return f"час {w['hour']} / сутки {w['day']} / неделя {w['week']} / всего {self.totals[event]}"
+
+        def top_lines(counter):
+            if not counter:
+                return "\n   нет данных"
+            return ''.join(f"\n   {name} — {count}" for name, count in counter.most_common(top))
+
+        def percent(part, whole):
+            return f"{part / whole * 100:.1f}%" if whole else "—"
+
+        starts, orders = self.totals['starts'], self.totals['orders']
+        text = "📊 СТАТИСТИКА\n\n"
+        text += f"🚀 Заявки: {windows_line('orders')}\n"
+        text += f"👋 Старты: {windows_line('starts')}\n"
+        text += f"📈 Конверсия /start → заявка: {percent(orders, starts)}\n"
+        text += f"⏰ Напоминания: {windows_line('reminders')}\n"
+        text += f"🔁 Заявки после напоминания: {windows_line('reminder_orders')}\n"
+        text += f"\n🏙 Топ городов:{top_lines(self.cities)}\n"
+        text += f"\n🚗 Топ марок:{top_lines(self.brands)}\n"
+        text += f"\n🔧 Топ запчастей:{top_lines(self.parts)}\n"
+
+        busy_hours = sorted(range(24), key=lambda h: self.order_hours[h], reverse=True)[:top]
+        busy_hours = [h for h in busy_hours if self.order_hours[h]]
+        text += "\n🕐 Часы с наибольшим числом заявок:"
+        text += ''.join(f"\n   {h:02d}:00 — {self.order_hours[h]}" for h in busy_hours) or "\n   нет данных"
+
+        text += "\n\n📉 Воронка (дошли до шага, отвал):"
+        previous = starts
+        for name in funnel_order:
+            reached = self.funnel[name]
+            text += f"\n   {name}: {reached} ({percent(max(previous - reached, 0), previous)})"
+            previous = reached
+        text += f"\n   Заявка отправлена: {orders} ({percent(max(previous - orders, 0), previous)})"
+        return text
+
+    def to_dict(self) -> dict:
+        return {
+            'totals': dict(self.totals),
+            'windows': {
+                event: {name: counter.to_dict() for name, counter in windows.items()}
+                for event, windows in self.windows.items()
+            },
+            'cities': dict(self.cities),
+            'brands': dict(self.brands),
+            'parts': dict(self.parts),
+            'order_hours': self.order_hours,
+            'funnel': dict(self.funnel),
+            'reminded': {str(user_id): ts for user_id, ts in self._reminded.items()},
+        }
+
+    def load(self):
+        """Загрузить сохраненные счетчики, если файл есть"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка загрузки статистики {self.path}: {e}")
+            return
+
+        self.totals = Counter(data.get('totals', {}))
+        for event, windows in data.get('windows', {}).items():
+            for name, counter in windows.items():
+                if event in self.windows and name in self.windows[event]:
+                    self.windows[event][name].load(counter)
+        self.cities = _bounded(data.get('cities', {}))
+        self.brands = _bounded(data.get('brands', {}))
+        self.parts = _bounded(data.get('parts', {}))
+        if len(data.get('order_hours', [])) == 24:
+            self.order_hours = list(data['order_hours'])
+        self.funnel = Counter(data.get('funnel', {}))
+        self._reminded = {int(user_id): ts for user_id, ts in data.get('reminded', {}).items()}
+        logger.info(f"✅ Статистика загружена: заявок {self.totals['orders']}")
+
+    def save(self):
+        """Сохранить счетчики, если они изменились с прошлого сохранения"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        expired = time.time() - REMINDER_ATTRIBUTION_SECONDS
+        self._reminded = {user_id: ts for user_id, ts in self._reminded.items() if ts >= expired}
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            logger.error(f"Ошибка сохранения статистики {self.path}: {e}")
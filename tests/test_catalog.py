@@ -0,0 +1,60 @@
+import random
+
+from catalog import PartCatalog, normalize_query
+
+WORDS = ['колодки', 'тормозные', 'передние', 'задние', 'фильтр', 'масляный', 'воздушный', 'ремень', 'грм']
+
+
+def make_catalog(tmp_path, items=500, **kwargs):
+    rng = random.Random(1)
+    path = tmp_path / 'catalog.csv'
+    lines = ['# название;артикул', 'Ёлочка ароматизатор;AR-1', 'Без артикула']
+    for i in range(items):
+        lines.append(f"{' '.join(rng.sample(WORDS, 3))};{rng.randint(100, 999)}-{i:04d}")
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    catalog = PartCatalog(str(path), **kwargs)
+    catalog.load()
+    return catalog
+
+
+def full_scan(catalog, query):
+    words = normalize_query(query).split()
+    return [i for i, key in enumerate(catalog._search_keys) if all(w in key for w in words)]
+
+
+def test_load_skips_comments_and_keeps_entries_without_article(tmp_path):
+    catalog = make_catalog(tmp_path, items=0)
+    assert catalog.entries == [('Ёлочка ароматизатор', 'AR-1'), ('Без артикула', '')]
+    assert catalog.message_text(1) == '🔧 Без артикула'
+
+
+def test_prefix_narrowing_matches_full_scan(tmp_path):
+    catalog = make_catalog(tmp_path)
+    for text in ['колодки перед', 'фильтр  МАСЛ', 'грм 12', 'р']:
+        for end in range(1, len(text) + 1):
+            query = text[:end]
+            assert list(catalog.search(query)) == full_scan(catalog, query), query
+
+
+def test_search_normalizes_query_and_article(tmp_path):
+    catalog = make_catalog(tmp_path, items=0)
+    assert list(catalog.search('елочка')) == [0]
+    assert list(catalog.search('ar1')) == [0]
+    assert list(catalog.search('')) == [0, 1]
+
+
+def test_cache_is_bounded_by_total_indices(tmp_path):
+    catalog = make_catalog(tmp_path, max_cached_indices=400)
+    for query in ['колодки', 'фильтр', 'ремень', 'грм', 'задние', 'передние']:
+        catalog.search(query)
+        assert catalog._cached_indices <= 400
+        assert catalog._cached_indices == sum(len(r) for r in catalog._cache.values())
+    # Выдача больше четверти лимита не кешируется
+    assert len(catalog.search('к')) > 100
+    assert not catalog.is_cached('к')
+
+
+def test_find_by_message(tmp_path):
+    catalog = make_catalog(tmp_path, items=0)
+    assert catalog.find_by_message('🔧 Ёлочка ароматизатор\nАртикул: AR-1') == ('Ёлочка ароматизатор', 'AR-1')
+    assert catalog.find_by_message('Ёлочка ароматизатор') is None
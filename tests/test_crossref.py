@@ -0,0 +1,154 @@
+import os
+import time
+
+import crossref
+from crossref import CrossReferenceIndex, extract_articles, normalize_article
+
+
+def _write(path, data: bytes, age: float = 60):
+    with open(path, 'wb') as f:
+        f.write(data)
+    past = time.time() - age
+    os.utime(path, (past, past))
+
+
+def test_normalize_article():
+    assert normalize_article('04465-33450') == '0446533450'
+    assert normalize_article(' gdb 3425 ') == 'GDB3425'
+    # Кириллические "А" и "С" совпадают с латинскими
+    assert normalize_article('АС123') == normalize_article('AC123')
+
+
+def test_extract_articles():
+    articles = extract_articles('Колодки 04465 33450, bosch 0 986 494 170')
+    assert '0446533450' in articles
+    assert '0986494170' in articles
+    assert extract_articles('GDB3425') == ['GDB3425']
+    assert extract_articles('Тормозные колодки') == []
+
+
+def test_groups_merge_transitively(tmp_path):
+    index = CrossReferenceIndex(str(tmp_path))
+    index.add_group(['A1000', 'B2000'])
+    index.add_group(['C3000', 'D4000'])
+    index.add_group(['B2000', 'C3000'])
+    index.ready = True
+    assert sorted(index.analogs('a-1000')) == ['B2000', 'C3000', 'D4000']
+    assert sorted(index.analogs('D4000')) == ['A1000', 'B2000', 'C3000']
+    assert index.analogs('E5000') == []
+    assert len(index.analogs('A1000', limit=2)) == 2
+
+
+def test_group_is_shared_by_analogs(tmp_path):
+    index = CrossReferenceIndex(str(tmp_path))
+    index.add_group(['A1000', 'B2000'])
+    index.add_group(['C3000', 'D4000'])
+    assert index.group('A1000') is None
+    index.ready = True
+    assert index.group('a-1000') == index.group('B2000')
+    assert index.group('A1000') != index.group('C3000')
+    assert index.group('E5000') is None
+
+
+def test_storage_grows_table():
+    index = CrossReferenceIndex('/nonexistent')
+    for i in range(3000):
+        index.add_group([f'X{i}', f'Y{i}'])
+    index.ready = True
+    assert len(index) == 6000
+    assert index.analogs('X2999') == ['Y2999']
+    assert index.analogs('Y0') == ['X0']
+
+
+def test_table_grows_outside_lock(monkeypatch):
+    index = CrossReferenceIndex('/nonexistent')
+    grown_table = crossref._Storage.grown_table
+    locked = []
+
+    def spy(storage, extra):
+        table = grown_table(storage, extra)
+        if table is not None:
+            locked.append(index._lock.locked())
+        return table
+
+    monkeypatch.setattr(crossref._Storage, 'grown_table', spy)
+    for i in range(1000):
+        index.add_group([f'X{i}', f'Y{i}'])
+    assert locked and not any(locked)
+
+
+def test_analogs_empty_until_loaded(tmp_path):
+    _write(tmp_path / 'a.csv', b'A1000;B2000\n')
+    index = CrossReferenceIndex(str(tmp_path))
+    assert index.analogs('A1000') == []
+    index.refresh()
+    assert index.analogs('A1000') == ['B2000']
+
+
+def test_refresh_reads_appended_lines(tmp_path):
+    path = tmp_path / 'a.csv'
+    _write(path, b'A1000;B2000\n')
+    index = CrossReferenceIndex(str(tmp_path))
+    assert index.refresh() == 1
+    assert index.refresh() == 0
+
+    with open(path, 'ab') as f:
+        f.write(b'B2000;C3000\n')
+    assert index.refresh() == 1
+    assert sorted(index.analogs('A1000')) == ['B2000', 'C3000']
+
+
+def test_final_line_without_newline(tmp_path):
+    path = tmp_path / 'a.csv'
+    _write(path, b'A1000;B2000')
+    index = CrossReferenceIndex(str(tmp_path))
+    assert index.refresh() == 1
+    assert index.analogs('A1000') == ['B2000']
+
+
+def test_fresh_unfinished_line_waits(tmp_path):
+    path = tmp_path / 'a.csv'
+    _write(path, b'A1000;B2000\nC3000', age=0)
+    index = CrossReferenceIndex(str(tmp_path))
+    index.refresh()
+    assert index.analogs('C3000') == []
+
+    with open(path, 'ab') as f:
+        f.write(b';D4000\n')
+    index.refresh()
+    assert index.analogs('C3000') == ['D4000']
+
+
+def test_final_line_loaded_when_file_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(crossref, 'FILE_SETTLE_SECONDS', 3600)
+    path = tmp_path / 'a.csv'
+    _write(path, b'A1000;B2000')
+    index = CrossReferenceIndex(str(tmp_path))
+    index.refresh()
+    assert index.analogs('A1000') == []
+    assert index.refresh() == 1
+    assert index.analogs('A1000') == ['B2000']
+
+
+def test_replaced_file_rebuilds_index(tmp_path):
+    path = tmp_path / 'a.csv'
+    _write(path, b'A1000;B2000\n')
+    index = CrossReferenceIndex(str(tmp_path))
+    index.refresh()
+
+    # Новая версия длиннее старой, но связи A1000-B2000 в ней уже нет
+    _write(path, b'A1000;C3000\nB2000;D4000\n', age=30)
+    index.refresh()
+    assert index.analogs('A1000') == ['C3000']
+    assert index.analogs('B2000') == ['D4000']
+
+
+def test_removed_file_rebuilds_index(tmp_path):
+    _write(tmp_path / 'a.csv', b'A1000;B2000\n')
+    _write(tmp_path / 'b.csv', b'C3000;D4000\n')
+    index = CrossReferenceIndex(str(tmp_path))
+    index.refresh()
+    os.remove(tmp_path / 'a.csv')
+    index.refresh()
+    assert index.analogs('A1000') == []
+    assert index.analogs('C3000') == ['D4000']
@@ -0,0 +1,134 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from recorder import Recorder, Scrubber, mask_phones, read_recording
+
+PROMPT = "Введите вин номер или номер стс"
+
+
+def _message(text, chat_id=555, **extra):
+    message = {
+        'message_id': 1,
+        'date': 0,
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Иван'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Иван', 'username': 'ivan'},
+        'text': text,
+    }
+    message.update(extra)
+    return {'update_id': 1, 'message': message}
+
+
+def test_mask_phones_keeps_format():
+    assert mask_phones('Иван +7 916 513-32-44') == 'Иван +7 000 000-00-00'
+    assert mask_phones('89165133244') == '80000000000'
+
+
+def test_ids_and_profile_names_are_pseudonymized():
+    scrubber = Scrubber(b'salt', keep_ids=['42'])
+    update = scrubber.scrub_update(_message('Москва'))
+    message = update['message']
+    assert message['from']['id'] != 555
+    assert message['from']['id'] == message['chat']['id']
+    assert 'Иван' not in json.dumps(update, ensure_ascii=False)
+    assert scrubber.scrub({'chat_id': '42', 'text': 'x'})['chat_id'] == '42'
+
+
+def test_contact_is_scrubbed():
+    scrubber = Scrubber(b'salt')
+    contact = {'phone_number': '+79165133244', 'first_name': 'Ivan', 'last_name': 'Petrov',
+               'user_id': 555, 'vcard': 'BEGIN:VCARD\nFN:Ivan Petrov\nEND:VCARD'}
+    scrubbed = scrubber.scrub_update(_message(None, contact=contact))['message']['contact']
+    dumped = json.dumps(scrubbed)
+    assert 'Ivan' not in dumped and 'Petrov' not in dumped
+    assert scrubbed['phone_number'] == '+70000000000'
+    assert scrubbed['user_id'] != 555
+
+
+def test_forward_origin_is_scrubbed():
+    scrubber = Scrubber(b'salt')
+    user_origin = {'type': 'user', 'date': 0,
+                   'sender_user': {'id': 777, 'is_bot': False, 'first_name': 'Petr', 'username': 'petr'}}
+    hidden_origin = {'type': 'hidden_user', 'date': 0, 'sender_user_name': 'Petr Ivanov'}
+    channel_origin = {'type': 'channel', 'date': 0, 'message_id': 1, 'author_signature': 'Petr',
+                      'chat': {'id': -100777, 'type': 'channel', 'title': 'Petr shop'}}
+    for origin in (user_origin, hidden_origin, channel_origin):
+        scrubbed = scrubber.scrub_update(_message('Москва', forward_origin=origin))
+        dumped = json.dumps(scrubbed['message']['forward_origin'])
+        assert 'Petr' not in dumped and 'petr' not in dumped and '777' not in dumped
+
+
+def test_contact_name_masked_where_phone_appears():
+    scrubber = Scrubber(b'salt')
+    scrubbed = scrubber.scrub_update(_message('Иван Петров +79165133244'))
+    assert scrubbed['message']['text'].endswith('+70000000000')
+    assert 'Иван' not in scrubbed['message']['text']
+
+    admin = scrubber.scrub({'chat_id': 1, 'text': 'Клиент: Иван Петров\nТел: +79165133244'})
+    assert 'Иван' not in admin['text']
+    # Имя без телефона этого клиента не трогается
+    other = scrubber.scrub({'chat_id': 1, 'text': 'Иван, ваш заказ принят'})
+    assert other['text'] == 'Иван, ваш заказ принят'
+
+
+def test_document_after_prompt_is_masked():
+    scrubber = Scrubber(b'salt', document_prompts=[PROMPT])
+    scrubber.watch_call({'chat_id': 555, 'text': f"🔢 *{PROMPT}:*"})
+    scrubbed = scrubber.scrub_update(_message('77 УХ 123456'))
+    assert scrubbed['message']['text'] == '00 XX 000000'
+
+    summary = scrubber.scrub({'chat_id': 555, 'text': 'VIN/СТС: 77 УХ 123456'})
+    assert summary['text'] == 'VIN/СТС: 00 XX 000000'
+
+    # Без вопроса про документ артикул остается как есть
+    assert scrubber.scrub_update(_message('0446533450'))['message']['text'] == '0446533450'
+
+
+def _record(path, texts):
+    recorder = Recorder(str(path), Scrubber(b'salt'))
+    for text in texts:
+        recorder.record_update(_message(text))
+        recorder.record_call('sendMessage', {'chat_id': 555, 'text': text}, True, 0.001)
+    recorder.close()
+
+
+def test_roundtrip(tmp_path):
+    path = tmp_path / 'rec.jsonl.gz'
+    _record(path, ['a', 'b'])
+    records = list(read_recording(str(path)))
+    assert [r['type'] for r in records] == ['update', 'call', 'update', 'call']
+    assert records[1]['method'] == 'sendMessage'
+    assert records[0]['ts'] <= records[1]['ts']
+
+
+def test_bot_identity_is_recorded(tmp_path):
+    path = tmp_path / 'rec.jsonl.gz'
+    recorder = Recorder(str(path), Scrubber(b'salt'))
+    recorder.record_bot({'id': 99, 'is_bot': True, 'first_name': 'Parts', 'username': 'parts_bot'})
+    recorder.close()
+    records = list(read_recording(str(path)))
+    assert records[0]['type'] == 'bot'
+    assert records[0]['bot']['username'] == 'parts_bot'
+
+
+def test_appended_runs_after_crash_are_readable(tmp_path):
+    path = tmp_path / 'rec.jsonl.gz'
+    _record(path, ['first'])
+    # Падение посреди записи фрагмента
+    with open(path, 'ab') as f:
+        f.write(gzip.compress(b'{"type": "update"}\n' * 100)[:40])
+    _record(path, ['second'])
+
+    texts = [r['update']['message']['text'] for r in read_recording(str(path)) if r['type'] == 'update']
+    assert texts == ['first', 'second']
+
+
+def test_truncated_tail_is_skipped(tmp_path):
+    path = tmp_path / 'rec.jsonl.gz'
+    _record(path, ['first'])
+    with open(path, 'ab') as f:
+        f.write(b'\x1f\x8b\x08garbage')
+    assert len(list(read_recording(str(path)))) == 2
@@ -0,0 +1,85 @@
+import time
+
+import stats
+from stats import LiveStats, RollingCounter
+
+
+def test_rolling_counter_expires_old_buckets():
+    counter = RollingCounter(60, 60)
+    counter.add(0)
+    counter.add(30)
+    counter.add(61)
+    assert counter.total(61) == 3
+    # Через час первая минута выпадает из окна
+    assert counter.total(60 * 60 + 1) == 1
+    assert counter.total(2 * 60 * 60) == 0
+
+
+def test_rolling_counter_reuses_slot():
+    counter = RollingCounter(60, 60)
+    counter.add(0, 5)
+    counter.add(60 * 60, 2)
+    assert counter.total(60 * 60) == 2
+
+
+def test_reminder_orders_counted_in_same_session():
+    s = LiveStats('/nonexistent')
+    s.record_start(1)
+    s.record_reminder(1)
+    s.record_order(1, 'Москва', 'BMW', [{'name': 'Колодки'}], 10)
+    assert s.totals['reminder_orders'] == 1
+
+
+def test_reminder_cleared_on_new_start():
+    s = LiveStats('/nonexistent')
+    s.record_reminder(1)
+    s.record_start(1)
+    s.record_order(1, 'Москва', 'BMW', [], 10)
+    assert s.totals['reminder_orders'] == 0
+
+
+def test_old_reminder_not_attributed():
+    s = LiveStats('/nonexistent')
+    s.record_reminder(1)
+    s._reminded[1] = time.time() - stats.REMINDER_ATTRIBUTION_SECONDS - 1
+    s.record_order(1, 'Москва', 'BMW', [], 10)
+    assert s.totals['reminder_orders'] == 0
+
+
+def test_save_and_load_keeps_counters_and_reminders(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    s = LiveStats(path)
+    s.record_start(1)
+    s.record_state('Город')
+    s.record_reminder(2)
+    s.record_order(1, ' Москва ', 'BMW', [{'name': 'Колодки'}], 10)
+    s.save()
+
+    loaded = LiveStats(path)
+    loaded.load()
+    assert loaded.totals['orders'] == 1
+    assert loaded.cities['москва'] == 1
+    assert loaded.funnel['Город'] == 1
+    assert loaded.window_totals('orders')['hour'] == 1
+    loaded.record_order(2, 'Москва', 'BMW', [], 11)
+    assert loaded.totals['reminder_orders'] == 1
+
+
+def test_free_text_counters_are_bounded(monkeypatch):
+    monkeypatch.setattr(stats, 'TOP_TRACKED_LIMIT', 10)
+    s = LiveStats('/nonexistent')
+    for _ in range(5):
+        s.record_order(1, 'Москва', 'BMW', [], 10)
+    for i in range(50):
+        s.record_order(1, f'Город {i}', 'BMW', [], 10)
+    assert len(s.cities) <= 10
+    assert s.cities.most_common(1)[0] == ('москва', 5)
+
+
+def test_report_renders_funnel():
+    s = LiveStats('/nonexistent')
+    s.record_start(1)
+    s.record_state('Город')
+    text = s.report(['Город', 'Марка'])
+    assert 'Город: 1 (0.0%)' in text
+    assert 'Марка: 0 (100.0%)' in text